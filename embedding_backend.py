@@ -0,0 +1,87 @@
+"""
+embedding_backend.py
+Adaptive Learning Companion — Embedding Backend Selection
+─────────────────────────────────────────────────────────
+Which embedder is in use, shared by ingest_data.py, tools.py and
+retrieval_test.py so ingestion and queries always agree on the model
+and on the collection the vectors live in.
+
+    EMBED_BACKEND=openai  (default) OpenAI text-embedding-3-small
+    EMBED_BACKEND=local   sentence-transformers all-MiniLM-L6-v2, on-device
+
+Local vectors are a different size and vector space, so they are kept in
+their own "<collection>_local" collection.
+
+embed_query() is the one query-embedding path (local model, or on-disk
+cache → OpenAI) used by the agent tools and the retrieval tests.
+
+Install:
+    pip install sentence-transformers   # only for EMBED_BACKEND=local
+"""
+
+import os
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import openai
+from dotenv import load_dotenv
+
+import embedding_cache
+
+load_dotenv()
+
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "openai").lower()
+
+EMBED_MODEL             = "text-embedding-3-small"
+LOCAL_EMBED_MODEL       = "all-MiniLM-L6-v2"
+LOCAL_COLLECTION_SUFFIX = "_local"
+DEFAULT_COLLECTION      = "learning_companion_kb"
+
+
+def collection_name(base: str = DEFAULT_COLLECTION) -> str:
+    """Name of the collection holding `base`'s vectors for the active backend."""
+    return base + LOCAL_COLLECTION_SUFFIX if EMBED_BACKEND == "local" else base
+
+
+@lru_cache(maxsize=1)
+def local_model():
+    """The sentence-transformers model, loaded once per process."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(LOCAL_EMBED_MODEL)
+
+
+def cached_query_embedding(text: str, dimensions: Optional[int] = None) -> Optional[tuple]:
+    """OpenAI embedding of `text` from the on-disk cache, or None on a miss."""
+    cached = embedding_cache.lookup([text], embedding_cache.model_tag(EMBED_MODEL, dimensions))[0]
+    return None if cached is None else tuple(cached.tolist())
+
+
+def cache_query_embeddings(texts: Sequence[str],
+                           embeddings: Sequence[Sequence[float]],
+                           dimensions: Optional[int] = None) -> None:
+    """Save fresh OpenAI embeddings to the on-disk cache."""
+    embedding_cache.store(texts, embeddings, embedding_cache.model_tag(EMBED_MODEL, dimensions))
+
+
+def embed_query(text: str, dimensions: Optional[int] = None) -> tuple:
+    """
+    Embed one query string with the active backend. Returns a tuple.
+    `dimensions` must match what the collection was ingested with; it is
+    ignored by the local model.
+    """
+    if EMBED_BACKEND == "local":
+        return tuple(local_model().encode([text], normalize_embeddings=True)[0].tolist())
+
+    embedding = cached_query_embedding(text, dimensions)
+    if embedding is not None:
+        return embedding
+
+    kwargs = {} if dimensions is None else {"dimensions": dimensions}
+    response = openai.embeddings.create(
+        input=[text],
+        model=EMBED_MODEL,
+        **kwargs
+    )
+    embedding = tuple(response.data[0].embedding)
+    cache_query_embeddings([text], [embedding], dimensions)
+    return embedding
@@ -0,0 +1,86 @@
+"""
+embedding_cache.py
+Adaptive Learning Companion — Persistent Embedding Cache
+─────────────────────────────────────────────────────────
+SQLite-backed cache of OpenAI embeddings so re-ingesting a modified PDF
+only pays for the chunks whose text actually changed.
+
+Each entry is keyed by SHA256(model + "\\0" + text) and stores the vector
+as raw float32 bytes (half the footprint of float64).
+
+Install:
+    pip install numpy
+"""
+
+import hashlib
+import sqlite3
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+CACHE_PATH = "./embedding_cache.db"
+
+# SQLite caps bound parameters per statement (999 on older builds)
+_MAX_PARAMS = 900
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            hash  BLOB PRIMARY KEY,
+            model TEXT NOT NULL,
+            vec   BLOB NOT NULL
+        )
+    """)
+    return conn
+
+
+def model_tag(model: str, dimensions: Optional[int] = None) -> str:
+    """Cache namespace for a model; reduced-dimension outputs are distinct vectors."""
+    return model if dimensions is None else f"{model}@{dimensions}"
+
+
+def cache_key(text: str, model: str) -> bytes:
+    """SHA-256 digest identifying one (model, text) embedding."""
+    return hashlib.sha256((model + "\0" + text).encode()).digest()
+
+
+def lookup(texts: Sequence[str], model: str) -> List[Optional[np.ndarray]]:
+    """
+    Fetch cached vectors for `texts`.
+    Returns a list aligned with `texts`; cache misses are None.
+    """
+    keys = [cache_key(t, model) for t in texts]
+    found = {}
+
+    conn = _connect()
+    for start in range(0, len(keys), _MAX_PARAMS):
+        batch = keys[start:start + _MAX_PARAMS]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT hash, vec FROM cache WHERE hash IN ({placeholders})",
+            batch
+        ).fetchall()
+        found.update(rows)
+    conn.close()
+
+    return [
+        np.frombuffer(found[k], dtype=np.float32) if k in found else None
+        for k in keys
+    ]
+
+
+def store(texts: Sequence[str], embeddings: Sequence[Sequence[float]], model: str) -> None:
+    """Insert (or refresh) the vectors for `texts` in the cache."""
+    rows = [
+        (cache_key(t, model), model, np.asarray(emb, dtype=np.float32).tobytes())
+        for t, emb in zip(texts, embeddings)
+    ]
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR REPLACE INTO cache (hash, model, vec) VALUES (?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
@@ -14,10 +14,13 @@ Install:
 """
 
 import os
+import asyncio
 from typing import Annotated
 from dotenv import load_dotenv
 
 from langchain_openai import ChatOpenAI
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
 from langchain_core.messages import SystemMessage, HumanMessage
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
@@ -49,11 +52,23 @@ class AgentState(TypedDict):
 
 TOOLS = [retrieve_content, get_student_progress, update_student_progress]
 
-llm = ChatOpenAI(
-    model="gpt-4o",
-    temperature=0.3,
-    api_key=os.getenv("OPENAI_API_KEY")
-).bind_tools(TOOLS)
+# Identical prompt + tool-config invocations are answered from memory
+# instead of making another round-trip to OpenAI.
+set_llm_cache(InMemoryCache())
+
+_LLM = None
+
+
+def get_llm():
+    """Lazily build the tool-bound chat model once and reuse it."""
+    global _LLM
+    if _LLM is None:
+        _LLM = ChatOpenAI(
+            model="gpt-4o",
+            temperature=0.3,
+            api_key=os.getenv("OPENAI_API_KEY")
+        ).bind_tools(TOOLS, parallel_tool_calls=True)
+    return _LLM
 
 SYSTEM_PROMPT = """You are an Adaptive Learning Companion — a patient, encouraging AI tutor.
 
@@ -73,6 +88,9 @@ Rules:
 - Use analogies and examples appropriate to the student's difficulty level.
 - Be encouraging. Normalise mistakes as part of learning.
 - Only call update_student_progress AFTER the student has answered a question.
+- When multiple tool calls are independent (e.g. get_student_progress and
+  retrieve_content for prerequisites), emit them in a single response as
+  parallel tool calls.
 """
 
 
@@ -87,7 +105,7 @@ def agent_node(state: AgentState) -> AgentState:
     and returns the LLM's response (which may contain tool call requests).
     """
     messages = [SystemMessage(content=SYSTEM_PROMPT)] + state["messages"]
-    response = llm.invoke(messages)
+    response = get_llm().invoke(messages)
     return {"messages": [response]}
 
 
@@ -97,7 +115,7 @@ def agent_node(state: AgentState) -> AgentState:
 
 # LangGraph's built-in ToolNode automatically:
 #   - Reads tool_calls from the last AIMessage
-#   - Executes the matching tool function
+#   - Executes the matching tool functions (parallel calls run concurrently)
 #   - Appends ToolMessage results back to state
 tool_node = ToolNode(tools=TOOLS)
 
@@ -166,13 +184,28 @@ def build_graph() -> StateGraph:
     return graph.compile()
 
 
+_APP = None
+
+
+def get_app():
+    """Return the compiled graph, building it on first use only."""
+    global _APP
+    if _APP is None:
+        _APP = build_graph()
+    return _APP
+
+
 # ─────────────────────────────────────────────────────────
 # RUN (interactive CLI loop)
 # ─────────────────────────────────────────────────────────
 
-def run_agent():
-    """Interactive CLI to chat with the learning agent."""
-    app = build_graph()
+async def run_agent():
+    """
+    Interactive CLI to chat with the learning agent.
+    Replies are streamed token-by-token via astream_events instead of
+    appearing only once the whole ReAct cycle has finished.
+    """
+    app = get_app()
 
     print("\n" + "="*60)
     print("  ADAPTIVE LEARNING COMPANION")
@@ -180,14 +213,17 @@ def run_agent():
     print("="*60)
     print("  Type 'quit' to exit.\n")
 
-    student_id = input("Enter your student ID (or press Enter for 'student_001'): ").strip()
+    # input() runs in a worker thread so it never blocks the event loop
+    student_id = (await asyncio.to_thread(
+        input, "Enter your student ID (or press Enter for 'student_001'): "
+    )).strip()
     if not student_id:
         student_id = "student_001"
 
     conversation_history = []
 
     while True:
-        user_input = input(f"\nYou: ").strip()
+        user_input = (await asyncio.to_thread(input, f"\nYou: ")).strip()
         if user_input.lower() in ("quit", "exit", "q"):
             print("\nGoodbye! Keep studying! 📚")
             break
@@ -198,16 +234,43 @@ def run_agent():
         contextual_input = f"[Student ID: {student_id}] {user_input}"
         conversation_history.append(HumanMessage(content=contextual_input))
 
-        # Run one full ReAct cycle
-        result = app.invoke({"messages": conversation_history})
-
-        # Extract final assistant message
+        # Run one full ReAct cycle, printing LLM tokens as they arrive
+        print(f"\nAgent: ", end="", flush=True)
+        printed = False         # anything written after "Agent: " this turn
+        streamed_runs = set()   # chat-model runs that produced stream tokens
+        last_model_run = None   # run that produced the final reply
+        result = None
+        async for event in app.astream_events(
+            {"messages": conversation_history}, version="v2"
+        ):
+            kind = event["event"]
+            if kind == "on_chat_model_start":
+                last_model_run = event["run_id"]
+            elif kind == "on_chat_model_stream":
+                token = event["data"]["chunk"].content
+                if token:
+                    if event["run_id"] not in streamed_runs:
+                        # New agent step: keep its text apart from earlier steps
+                        if printed:
+                            print("\n\n", end="")
+                        streamed_runs.add(event["run_id"])
+                    print(token, end="", flush=True)
+                    printed = True
+            elif kind == "on_chain_end" and not event["parent_ids"]:
+                # Top-level graph finished — this is the final state
+                result = event["data"]["output"]
+
+        # LLM cache hits return without streaming; print the reply directly
         final_message = result["messages"][-1]
-        print(f"\nAgent: {final_message.content}")
+        if last_model_run not in streamed_runs:
+            if printed:
+                print("\n\n", end="")
+            print(final_message.content, end="")
+        print()
 
         # Update history for multi-turn memory
         conversation_history = result["messages"]
 
 
 if __name__ == "__main__":
-    run_agent()
\ No newline at end of file
+    asyncio.run(run_agent())
@@ -9,22 +9,41 @@ Usage:
     python ingest_data.py --pdf your_book.pdf --topic "AI" --difficulty intermediate
 
 Install:
-    pip install pdfplumber chromadb openai python-dotenv
+    pip install pdfplumber chromadb openai python-dotenv numpy
+    pip install faiss-cpu   # optional: int8-quantized search index
+    pip install sentence-transformers   # optional: EMBED_BACKEND=local
 """
 
 import os
 import re
 import json
+import time
 import hashlib
+from bisect import bisect_right
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Tuple
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pdfplumber
 import chromadb
 from chromadb.config import Settings
 import openai
 from dotenv import load_dotenv
 
+try:
+    import faiss
+except ImportError:  # optional — only needed for the quantized index
+    faiss = None
+
+import embedding_cache
+from embedding_backend import (
+    EMBED_BACKEND, EMBED_MODEL, LOCAL_EMBED_MODEL,
+    collection_name as backend_collection, local_model,
+)
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -32,15 +51,36 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # STEP 1: EXTRACT TEXT FROM PDF
 # ─────────────────────────────────────────────────────────
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract raw text page-by-page using pdfplumber."""
-    full_text = ""
+def _extract_page_range(args: Tuple[str, int, int]) -> List[Tuple[int, str]]:
+    """Worker: extract pages [start, end) with a single pdfplumber handle."""
+    pdf_path, start, end = args
+    with pdfplumber.open(pdf_path) as pdf:
+        return [(page_num + 1, pdf.pages[page_num].extract_text())
+                for page_num in range(start, end)]
+
+
+def extract_text_from_pdf(pdf_path: str, max_workers: Optional[int] = None) -> str:
+    """
+    Extract raw text page-by-page using pdfplumber.
+    pdfplumber's layout analysis is CPU-bound pure Python, so contiguous
+    page ranges are fanned out across a process pool (one per core).
+    """
     with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
-            if text:
-                # Tag each page so we can track source page in metadata
-                full_text += f"\n\n[PAGE_{page_num}]\n{text}"
+        n_pages = len(pdf.pages)
+
+    workers = max(1, min(max_workers or os.cpu_count() or 1, n_pages))
+    span = max(1, -(-n_pages // workers))
+    ranges = [(pdf_path, start, min(start + span, n_pages))
+              for start in range(0, n_pages, span)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns ranges in submission order, so pages stay in order
+        pages = [page for result in executor.map(_extract_page_range, ranges)
+                 for page in result]
+
+    # Tag each page so we can track source page in metadata
+    full_text = "".join(f"\n\n[PAGE_{page_num}]\n{text}"
+                        for page_num, text in pages if text)
     print(f"✓ Extracted {len(full_text):,} characters from {pdf_path}")
     return full_text
 
@@ -49,6 +89,20 @@ def extract_text_from_pdf(pdf_path: str) -> str:
 # STEP 2: CLEAN TEXT
 # ─────────────────────────────────────────────────────────
 
+# Compiled once at import — clean_text runs over the whole book
+_RE_PAGE_OF      = re.compile(r'\bPage\s+\d+\s+of\s+\d+\b', re.IGNORECASE)
+_RE_BARE_NUMBER  = re.compile(r'^\s*\d+\s*$', re.MULTILINE)
+_RE_COPYRIGHT    = re.compile(r'Copyright\s+©?\s*\d{4}.*', re.IGNORECASE)
+_RE_RIGHTS       = re.compile(r'All rights reserved.*', re.IGNORECASE)
+_RE_HTML_TAG     = re.compile(r'<[^>]+>')
+_RE_URL          = re.compile(r'https?://\S+')
+_RE_DIVIDER      = re.compile(r'[-_]{4,}')
+_RE_BULLET       = re.compile(r'^\s*[•●▪◦]\s*', re.MULTILINE)
+_RE_ELLIPSIS     = re.compile(r'\.{3,}')
+_RE_BLANK_LINES  = re.compile(r'\n{3,}')
+_RE_HSPACE       = re.compile(r'[ \t]+')
+
+
 def clean_text(text: str) -> str:
     """
     Strip domain-specific noise:
@@ -59,29 +113,29 @@ def clean_text(text: str) -> str:
     - Excessive whitespace / punctuation
     """
     # Page numbers (standalone digits or "Page X of Y")
-    text = re.sub(r'\bPage\s+\d+\s+of\s+\d+\b', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
+    text = _RE_PAGE_OF.sub('', text)
+    text = _RE_BARE_NUMBER.sub('', text)
 
     # Copyright / legal boilerplate
-    text = re.sub(r'Copyright\s+©?\s*\d{4}.*', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'All rights reserved.*', '', text, flags=re.IGNORECASE)
+    text = _RE_COPYRIGHT.sub('', text)
+    text = _RE_RIGHTS.sub('', text)
 
     # HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+    text = _RE_HTML_TAG.sub('', text)
 
     # URLs
-    text = re.sub(r'https?://\S+', '', text)
+    text = _RE_URL.sub('', text)
 
     # Repeated dashes / underscores used as dividers
-    text = re.sub(r'[-_]{4,}', '', text)
+    text = _RE_DIVIDER.sub('', text)
 
     # Normalize bullet symbols
-    text = re.sub(r'^\s*[•●▪◦]\s*', '• ', text, flags=re.MULTILINE)
+    text = _RE_BULLET.sub('• ', text)
 
     # Collapse excessive punctuation
-    text = re.sub(r'\.{3,}', '...', text)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r'[ \t]+', ' ', text)
+    text = _RE_ELLIPSIS.sub('...', text)
+    text = _RE_BLANK_LINES.sub('\n\n', text)
+    text = _RE_HSPACE.sub(' ', text)
 
     return text.strip()
 
@@ -90,6 +144,29 @@ def clean_text(text: str) -> str:
 # STEP 3: SEMANTIC CHUNKING
 # ─────────────────────────────────────────────────────────
 
+_RE_PAGE_MARKER = re.compile(r'\[PAGE_(\d+)\]')
+
+
+def _iter_paragraphs(text: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_num, paragraph) pairs in a single scan over the [PAGE_N]
+    markers, one page at a time, instead of materialising every segment.
+    Text before the first marker counts as page 1.
+    """
+    page, pos = 1, 0
+    markers = _RE_PAGE_MARKER.finditer(text)
+    while True:
+        marker = next(markers, None)
+        end = marker.start() if marker else len(text)
+        for para in text[pos:end].split('\n\n'):
+            para = para.strip()
+            if para:
+                yield page, para
+        if marker is None:
+            return
+        page, pos = int(marker.group(1)), marker.end()
+
+
 def semantic_chunk(text: str,
                    max_chunk_size: int = 1000,
                    overlap: int = 150) -> List[Dict]:
@@ -102,44 +179,39 @@ def semantic_chunk(text: str,
     - Tracks page number from [PAGE_N] markers.
     """
     chunks = []
-    current_chunk = ""
-    current_page = 1
+    # The chunk being built is  head + "\n\n".join(paras) + "\n\n"  where
+    # head is the overlap carried from the previous chunk. The loop only does
+    # length arithmetic; the chunk string is assembled once, on flush.
+    head = ""
+    paras: List[str] = []
+    buf_len = 0
     chunk_start_page = 1
     idx = 0
 
-    # Split preserving page markers
-    segments = re.split(r'(\[PAGE_\d+\])', text)
-
-    for segment in segments:
-        page_match = re.match(r'\[PAGE_(\d+)\]', segment)
-        if page_match:
-            current_page = int(page_match.group(1))
-            continue
-
-        paragraphs = segment.split('\n\n')
-        for para in paragraphs:
-            para = para.strip()
-            if not para:
-                continue
-
-            if len(current_chunk) + len(para) <= max_chunk_size:
-                if not current_chunk:
-                    chunk_start_page = current_page
-                current_chunk += para + "\n\n"
-            else:
-                if current_chunk:
-                    chunks.append({
-                        'text': current_chunk.strip(),
-                        'chunk_index': idx,
-                        'start_page': chunk_start_page,
-                    })
-                    idx += 1
-                # Overlap: carry last `overlap` chars into new chunk
-                overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
-                current_chunk = overlap_text + para + "\n\n"
+    for current_page, para in _iter_paragraphs(text):
+        para_len = len(para)
+        if buf_len + para_len <= max_chunk_size:
+            if not buf_len:
                 chunk_start_page = current_page
+            paras.append(para)
+            buf_len += para_len + 2
+        else:
+            current_chunk = head + "\n\n".join(paras) + "\n\n" if paras else head
+            if current_chunk:
+                chunks.append({
+                    'text': current_chunk.strip(),
+                    'chunk_index': idx,
+                    'start_page': chunk_start_page,
+                })
+                idx += 1
+            # Overlap: carry last `overlap` chars into new chunk
+            head = current_chunk[-overlap:] if buf_len > overlap else current_chunk
+            paras = [para]
+            buf_len = len(head) + para_len + 2
+            chunk_start_page = current_page
 
     # Final chunk
+    current_chunk = head + "\n\n".join(paras) + "\n\n" if paras else head
     if current_chunk.strip():
         chunks.append({
             'text': current_chunk.strip(),
@@ -155,12 +227,61 @@ def semantic_chunk(text: str,
 # STEP 4: METADATA ENRICHMENT
 # ─────────────────────────────────────────────────────────
 
+# Content-signal detectors folded into one pattern so each chunk is scanned
+# once. Every signal is a named group inside a zero-width lookahead: nothing
+# is consumed, so a long match (e.g. "before.*study") cannot hide another
+# signal that overlaps it.
+_RE_FEATURES = re.compile(
+    r'(?=(?:'
+    r'(?P<practice>exercise|problem|question \d+|quiz|task \d+)'
+    r'|(?P<prereq>prerequisite|before.*study|prior knowledge|required.*understand)'
+    r'|(?P<examples>for example|e\.g\.|such as|consider)'
+    r'|(?P<defs>is defined as|refers to|means that|is called)'
+    r'|(?P<steps>step \d+|first[,\s]|second[,\s]|finally[,\s])'
+    r'))',
+    re.I
+)
+# Once these are seen nothing else can change the metadata (practice
+# outranks prereq when picking content_type)
+_DECISIVE_FEATURES = frozenset({"practice", "examples", "defs", "steps"})
+
+
+def _detect_features(chunk_text: str) -> set:
+    """Return the names of the feature groups present in `chunk_text`."""
+    found = set()
+    for match in _RE_FEATURES.finditer(chunk_text):
+        found.add(match.lastgroup)
+        if _DECISIVE_FEATURES <= found:
+            break
+    return found
+
+
+# No signal can match across this: "." stops at "\n" and "\s" rejects "\0"
+_CHUNK_SEP = "\0\n"
+
+
+def _detect_features_batch(texts: List[str]) -> List[set]:
+    """
+    Feature detection for a whole ingest in a single finditer pass over the
+    concatenated chunk texts, instead of one regex call per chunk.
+    Returns one feature set per text, in order.
+    """
+    features = [set() for _ in texts]
+    # ends[i] is the offset where chunk i+1 begins in the joined text
+    ends = list(accumulate(len(t) + len(_CHUNK_SEP) for t in texts))
+    for match in _RE_FEATURES.finditer(_CHUNK_SEP.join(texts)):
+        features[bisect_right(ends, match.start())].add(match.lastgroup)
+    return features
+
+
 def build_metadata(chunk_text: str,
                    chunk_index: int,
                    start_page: int,
                    source_file: str,
                    topic: str,
-                   difficulty: str) -> Dict[str, str]:
+                   difficulty: str,
+                   ingest_ts: str,
+                   features: Optional[set] = None) -> Dict[str, str]:
     """
     Attach at least 3 mandatory searchable tags + extra signals.
 
@@ -174,20 +295,27 @@ def build_metadata(chunk_text: str,
         5. chunk_index    — position in document
         6. start_page     — PDF page number for citation
         7. char_count     — length for filtering
-        8. last_updated   — ingestion timestamp
+        8. last_updated   — ingestion timestamp (shared by the whole ingest)
         9. doc_id         — unique MD5 for deduplication
        10. has_examples   — signals presence of illustrative content
        11. has_definitions— signals definitional content
        12. has_steps      — signals procedural/how-to content
+
+    `features` may be precomputed for many chunks at once with
+    _detect_features_batch; otherwise the chunk is scanned here.
     """
     # Auto-detect content type from text patterns
-    if re.search(r'exercise|problem|question \d+|quiz|task \d+', chunk_text, re.I):
+    if features is None:
+        features = _detect_features(chunk_text)
+    if "practice" in features:
         content_type = "practice"
-    elif re.search(r'prerequisite|before.*study|prior knowledge|required.*understand', chunk_text, re.I):
+    elif "prereq" in features:
         content_type = "prerequisites"
     else:
         content_type = "explanation"
 
+    # Stays MD5 (not a faster hash) on purpose: doc_id must be stable so
+    # re-ingesting a PDF upserts over its chunks instead of duplicating them
     doc_id = hashlib.md5(
         f"{source_file}_{chunk_index}_{chunk_text[:60]}".encode()
     ).hexdigest()
@@ -202,12 +330,12 @@ def build_metadata(chunk_text: str,
         "chunk_index":  str(chunk_index),
         "start_page":   str(start_page),
         "char_count":   str(len(chunk_text)),
-        "last_updated": datetime.now().isoformat(),
+        "last_updated": ingest_ts,
         "doc_id":       doc_id,
         # ── CONTENT FEATURE FLAGS ─────────────────────────
-        "has_examples":    str(bool(re.search(r'for example|e\.g\.|such as|consider', chunk_text, re.I))),
-        "has_definitions": str(bool(re.search(r'is defined as|refers to|means that|is called', chunk_text, re.I))),
-        "has_steps":       str(bool(re.search(r'step \d+|first[,\s]|second[,\s]|finally[,\s]', chunk_text, re.I))),
+        "has_examples":    str("examples" in features),
+        "has_definitions": str("defs" in features),
+        "has_steps":       str("steps" in features),
     }
 
 
@@ -215,12 +343,67 @@ def build_metadata(chunk_text: str,
 # STEP 5: EMBED VIA OPENAI
 # ─────────────────────────────────────────────────────────
 
-def get_embeddings(texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
-    """Batch embed texts using OpenAI embeddings API."""
+EMBED_DIMENSIONS  = 512   # text-embedding-3-* truncate + renormalise; 3× smaller than 1536
+EMBED_BATCH_SIZE  = 256   # well under OpenAI's 2048-input / 300k-token request cap
+EMBED_MAX_WORKERS = 8     # concurrent in-flight embedding requests
+EMBED_MAX_RETRIES = 5
+
+
+def _embed_batch(batch: List[str], model: str, dimensions: Optional[int]) -> List[List[float]]:
+    """Embed one sub-batch, backing off exponentially on rate limits (429)."""
+    kwargs = {} if dimensions is None else {"dimensions": dimensions}
+    for attempt in range(EMBED_MAX_RETRIES):
+        try:
+            response = openai.embeddings.create(input=batch, model=model, **kwargs)
+            return [item.embedding for item in response.data]
+        except openai.RateLimitError:
+            if attempt == EMBED_MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def get_embeddings(texts: List[str],
+                   model: str = EMBED_MODEL,
+                   dimensions: Optional[int] = EMBED_DIMENSIONS) -> np.ndarray:
+    """
+    Batch embed texts using OpenAI embeddings API.
+    Vectors already in the local embedding cache are reused; only cache
+    misses are sent to the API, split into sub-batches of EMBED_BATCH_SIZE
+    that are dispatched concurrently.
+
+    Returns one contiguous float32 array of shape (len(texts), dim) rather
+    than a list of lists of boxed Python floats. `dimensions=None` keeps the
+    model's full output size.
+    """
     # ChromaDB can auto-embed, but explicit embeddings give us model control
-    response = openai.embeddings.create(input=texts, model=model)
-    embeddings = [item.embedding for item in response.data]
-    print(f"✓ Generated {len(embeddings)} embeddings using {model}")
+    tag = embedding_cache.model_tag(model, dimensions)
+    embeddings = embedding_cache.lookup(texts, tag)
+    miss_idx = [i for i, emb in enumerate(embeddings) if emb is None]
+    uncached_texts = [texts[i] for i in miss_idx]
+
+    if uncached_texts:
+        batches = [uncached_texts[i:i + EMBED_BATCH_SIZE]
+                   for i in range(0, len(uncached_texts), EMBED_BATCH_SIZE)]
+        # executor.map yields results in batch order, so ordering is preserved
+        with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as executor:
+            results = executor.map(lambda b: _embed_batch(b, model, dimensions), batches)
+            fresh = [emb for batch_embs in results for emb in batch_embs]
+        embedding_cache.store(uncached_texts, fresh, tag)
+        for i, emb in zip(miss_idx, fresh):
+            embeddings[i] = emb
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    print(f"✓ Generated {len(uncached_texts)} embeddings using {tag} "
+          f"({len(texts) - len(uncached_texts)} served from cache)")
+    return embeddings
+
+
+def get_local_embeddings(texts: List[str]) -> np.ndarray:
+    """Embed texts on-device with sentence-transformers (EMBED_BACKEND=local)."""
+    embeddings = local_model().encode(
+        texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True
+    ).astype(np.float32)
+    print(f"✓ Generated {len(embeddings)} embeddings using {LOCAL_EMBED_MODEL} (local)")
     return embeddings
 
 
@@ -228,30 +411,72 @@ def get_embeddings(texts: List[str], model: str = "text-embedding-3-small") -> L
 # STEP 6: STORE IN CHROMADB
 # ─────────────────────────────────────────────────────────
 
-def store_in_chromadb(chunks: List[Dict],
-                      embeddings: List[List[float]],
-                      collection_name: str = "learning_companion_kb") -> chromadb.Collection:
-    """
-    Store chunks, embeddings, and metadata in a persistent ChromaDB collection.
-    Uses a named collection scoped to this project (Lab 2 'namespace' requirement).
-    """
-    client = chromadb.PersistentClient(
+@lru_cache(maxsize=1)
+def _client():
+    """One PersistentClient per process — construction bootstraps SQLite + HNSW."""
+    return chromadb.PersistentClient(
         path="./chroma_db",
         settings=Settings(anonymized_telemetry=False)
     )
 
-    collection = client.get_or_create_collection(
-        name=collection_name,
-        metadata={"project": "Adaptive Learning Companion", "lab": "Lab2"}
-    )
 
-    documents  = [c['text']     for c in chunks]
-    metadatas  = [c['metadata'] for c in chunks]
-    ids        = [c['metadata']['doc_id'] for c in chunks]
+def get_collection(collection_name: str = "learning_companion_kb") -> chromadb.Collection:
+    """
+    Open (or create) the project collection. New collections record the
+    embedding backend/size they are built with so query-time embeddings match.
+
+    Metadata is only written while the collection holds no vectors:
+    get_or_create_collection on chromadb 0.4.x overwrites an existing
+    collection's metadata, which would relabel an old 1536-d collection as
+    512-d. An empty collection (e.g. one created by an older agent before
+    the first ingest) is stamped like a new one.
+    """
+    client = _client()
+    try:
+        collection = client.get_collection(name=collection_name)
+    except Exception:  # not found (ValueError / NotFoundError across versions)
+        collection = None
+    if collection is not None and collection.count() > 0:
+        return collection
+
+    metadata = {"project": "Adaptive Learning Companion", "lab": "Lab2"}
+    if EMBED_BACKEND == "local":
+        metadata["embedding_model"] = LOCAL_EMBED_MODEL
+    else:
+        metadata["embedding_dimensions"] = EMBED_DIMENSIONS
+    if collection is None:
+        return client.get_or_create_collection(name=collection_name, metadata=metadata)
+    collection.modify(metadata=metadata)
+    return collection
+
+
+def collection_dimensions(collection: chromadb.Collection) -> Optional[int]:
+    """Embedding size a collection was built with (None = model default, 1536)."""
+    return (collection.metadata or {}).get("embedding_dimensions")
 
-    collection.add(
+
+def store_in_chromadb(chunks: List[Dict],
+                      embeddings: np.ndarray,
+                      collection_name: str = "learning_companion_kb") -> chromadb.Collection:
+    """
+    Store chunks, embeddings, and metadata in a persistent ChromaDB collection.
+    Uses a named collection scoped to this project (Lab 2 'namespace' requirement).
+    """
+    collection = get_collection(collection_name)
+
+    # One pass over chunks into pre-sized lists
+    n = len(chunks)
+    documents, metadatas, ids = [None] * n, [None] * n, [None] * n
+    for i, c in enumerate(chunks):
+        meta = c['metadata']
+        documents[i] = c['text']
+        metadatas[i] = meta
+        ids[i]       = meta['doc_id']
+
+    # upsert (not add) so re-ingesting the same PDF overwrites instead of erroring
+    collection.upsert(
         documents=documents,
-        embeddings=embeddings,
+        embeddings=embeddings.tolist(),
         metadatas=metadatas,
         ids=ids
     )
@@ -261,6 +486,66 @@ def store_in_chromadb(chunks: List[Dict],
     return collection
 
 
+# ─────────────────────────────────────────────────────────
+# STEP 7: INT8-QUANTIZED SEARCH INDEX (optional, needs faiss)
+# ─────────────────────────────────────────────────────────
+
+def quantized_index_path(collection_name: str) -> str:
+    return f"./chroma_db/{collection_name}.faiss"
+
+
+def _remove_files(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def build_quantized_index(collection: chromadb.Collection, index_path: str) -> None:
+    """
+    Mirror every vector in the collection into a FAISS scalar-quantized
+    (SQ8) index: 1 byte per dimension instead of 4, at <1% recall loss.
+    ChromaDB stays the store for documents and metadata; the index's row
+    order is saved next to it as a list of doc ids for the join.
+
+    Both files are written to temp paths and published with os.replace,
+    ids first. If the index can't be rebuilt, any previous one is deleted
+    so searches fall back to Chroma instead of missing the new chunks.
+    """
+    ids_path = index_path + ".ids.json"
+    if faiss is None:
+        _remove_files(index_path, ids_path)
+        print("  (faiss not installed — skipping quantized index)")
+        return
+
+    tmp_index, tmp_ids = index_path + ".tmp", ids_path + ".tmp"
+    try:
+        data = collection.get(include=["embeddings"])
+        if not data["ids"]:
+            _remove_files(index_path, ids_path)
+            return
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        faiss.normalize_L2(vectors)  # inner product == cosine similarity
+
+        index = faiss.IndexScalarQuantizer(
+            vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(vectors)
+        index.add(vectors)
+        faiss.write_index(index, tmp_index)
+        with open(tmp_ids, "w") as f:
+            json.dump(data["ids"], f)
+        os.replace(tmp_ids, ids_path)
+        os.replace(tmp_index, index_path)
+    except Exception as exc:
+        _remove_files(tmp_index, tmp_ids, index_path, ids_path)
+        print(f"  (quantized index build failed: {exc} — removed the stale index)")
+        return
+
+    print(f"✓ Wrote int8 index of {index.ntotal} vectors → {index_path}")
+
+
 # ─────────────────────────────────────────────────────────
 # MAIN PIPELINE
 # ─────────────────────────────────────────────────────────
@@ -270,12 +555,16 @@ def ingest(pdf_path: str,
            difficulty: str,
            collection_name: str = "learning_companion_kb"):
 
+    # Local vectors have a different size/space — never mix them with OpenAI ones
+    collection_name = backend_collection(collection_name)
+
     print(f"\n{'='*60}")
     print("ADAPTIVE LEARNING COMPANION — INGESTION PIPELINE")
     print(f"{'='*60}")
     print(f"  PDF:        {pdf_path}")
     print(f"  Topic:      {topic}")
     print(f"  Difficulty: {difficulty}")
+    print(f"  Embedder:   {EMBED_BACKEND}")
     print(f"{'='*60}\n")
 
     # 1. Extract
@@ -288,23 +577,43 @@ def ingest(pdf_path: str,
     chunks = semantic_chunk(clean)
 
     # 4. Enrich metadata
-    for chunk in chunks:
+    texts = [c['text'] for c in chunks]
+    features = _detect_features_batch(texts)
+    ingest_ts = datetime.now().isoformat()
+    for chunk, chunk_features in zip(chunks, features):
         chunk['metadata'] = build_metadata(
             chunk_text=chunk['text'],
             chunk_index=chunk['chunk_index'],
             start_page=chunk['start_page'],
             source_file=pdf_path,
             topic=topic,
-            difficulty=difficulty
+            difficulty=difficulty,
+            ingest_ts=ingest_ts,
+            features=chunk_features
         )
 
-    # 5. Embed
-    texts = [c['text'] for c in chunks]
-    embeddings = get_embeddings(texts)
+    # 5. Embed — identical chunks (repeated preambles, disclaimers) are
+    #    embedded once and scattered back to every position they occur
+    unique_map: Dict[str, int] = {}
+    unique_texts: List[str] = []
+    for t in texts:
+        if t not in unique_map:
+            unique_map[t] = len(unique_texts)
+            unique_texts.append(t)
+    if EMBED_BACKEND == "local":
+        unique_embs = get_local_embeddings(unique_texts)
+    else:
+        # Match the vector size of the target collection (older ones are 1536-d)
+        dimensions = collection_dimensions(get_collection(collection_name))
+        unique_embs = get_embeddings(unique_texts, dimensions=dimensions)
+    embeddings = unique_embs[[unique_map[t] for t in texts]]
 
     # 6. Store
     collection = store_in_chromadb(chunks, embeddings, collection_name)
 
+    # 7. Quantized index (rebuilt over the whole collection)
+    build_quantized_index(collection, quantized_index_path(collection_name))
+
     # ── Summary ──────────────────────────────────────────
     print(f"\n{'='*60}")
     print("INGESTION COMPLETE")
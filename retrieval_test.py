@@ -12,39 +12,59 @@ Requirements:
     pip install chromadb openai python-dotenv
     .env file with OPENAI_API_KEY=sk-...
     ChromaDB populated by running: python ingest_data.py ...
+    With EMBED_BACKEND=local, tests the local collection and embedder instead.
 """
 
 import os
 import json
+from functools import lru_cache
 from dotenv import load_dotenv
 import openai
 import chromadb
 from chromadb.config import Settings
 
+from embedding_backend import collection_name, embed_query
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-COLLECTION_NAME = "learning_companion_kb"
+COLLECTION_NAME = collection_name()   # same collection ingest_data.py wrote
 CHROMA_PATH     = "./chroma_db"
 
 # ─────────────────────────────────────────────────────────
 # HELPERS
 # ─────────────────────────────────────────────────────────
 
-def get_collection():
-    client = chromadb.PersistentClient(
+@lru_cache(maxsize=1)
+def _client():
+    # Built lazily (not at import) so main() can check CHROMA_PATH exists
+    # before a client creates it; then reused for every later call.
+    return chromadb.PersistentClient(
         path=CHROMA_PATH,
         settings=Settings(anonymized_telemetry=False)
     )
-    return client.get_or_create_collection(name=COLLECTION_NAME)
 
 
-def embed(text: str) -> list:
-    response = openai.embeddings.create(
-        input=[text],
-        model="text-embedding-3-small"
-    )
-    return response.data[0].embedding
+def get_collection():
+    # Read-only: creating it here would leave it without the embedding
+    # metadata ingest_data.py records
+    return _client().get_collection(name=COLLECTION_NAME)
+
+
+@lru_cache(maxsize=1)
+def _embedding_dimensions():
+    """Embedding size recorded by ingest_data (None = model default, 1536)."""
+    return (get_collection().metadata or {}).get("embedding_dimensions")
+
+
+@lru_cache(maxsize=1024)
+def embed(text: str) -> tuple:
+    """
+    Embed a query string. Memoized in-process, and backed by the on-disk
+    embedding cache so re-running the tests doesn't re-hit the API.
+    Returns a tuple (hashable); wrap in list() before passing to Chroma.
+    """
+    return embed_query(text, _embedding_dimensions())
 
 
 def print_results(results: dict):
@@ -64,6 +84,31 @@ def print_results(results: dict):
         print(f"    Preview  : {doc[:200].strip()}...")
 
 
+def run_query(collection, query: str, n_results: int,
+              where: dict = None, include: tuple = ("distances",)) -> dict:
+    """
+    Query with only the fields a pass/fail check needs. Chroma always
+    returns ids, so full documents can be fetched later for the preview.
+    """
+    kwargs = {} if where is None else {"where": where}
+    return collection.query(
+        query_embeddings=[list(embed(query))],
+        n_results=n_results,
+        include=list(include),
+        **kwargs
+    )
+
+
+def print_top_result(collection, results: dict):
+    """Fetch documents + metadata for the top hit only and print it."""
+    top_ids = results["ids"][0][:1]
+    if not top_ids:
+        print_results({})
+        return
+    top = collection.get(ids=top_ids, include=["documents", "metadatas"])
+    print_results({"documents": [top["documents"]], "metadatas": [top["metadatas"]]})
+
+
 def section(title: str, test_num: int):
     print(f"\n{'='*60}")
     print(f"  TEST {test_num}: {title}")
@@ -80,17 +125,13 @@ def test_semantic_search(collection):
     print(f"  Query   : \"{query}\"")
     print(f"  Filter  : None")
 
-    results = collection.query(
-        query_embeddings=[embed(query)],
-        n_results=3,
-        include=["documents", "metadatas"]
-    )
+    results = run_query(collection, query, n_results=3)
 
-    print_results(results)
+    n_found = len(results["distances"][0])
+    print_top_result(collection, results)
 
-    docs = results["documents"][0]
-    passed = len(docs) > 0
-    print(f"\n  {'PASS' if passed else 'FAIL'} — returned {len(docs)} result(s)")
+    passed = n_found > 0
+    print(f"\n  {'PASS' if passed else 'FAIL'} — returned {n_found} result(s)")
     return passed
 
 
@@ -105,27 +146,26 @@ def test_difficulty_filter(collection):
     print(f"  Filter  : difficulty = 'intermediate'")
 
     try:
-        results = collection.query(
-            query_embeddings=[embed(query)],
-            n_results=3,
+        # Metadata is needed to validate the filter; documents are not
+        results = run_query(
+            collection, query, n_results=3,
             where={"difficulty": {"$eq": "intermediate"}},
-            include=["documents", "metadatas"]
+            include=("metadatas",)
         )
     except Exception as e:
         print(f"\n  Filter error (no 'intermediate' docs in DB?): {e}")
         return False
 
-    print_results(results)
-
-    docs   = results["documents"][0]
     metas  = results["metadatas"][0]
+    print_top_result(collection, results)
+
     # Validate every result actually has difficulty=intermediate
     all_correct = all(m.get("difficulty") == "intermediate" for m in metas)
-    passed = len(docs) > 0 and all_correct
+    passed = len(metas) > 0 and all_correct
 
     if not all_correct:
         print(f"\n  Some results did not match filter!")
-    print(f"\n  {'PASS' if passed else 'FAIL'} — {len(docs)} result(s), all difficulty=intermediate: {all_correct}")
+    print(f"\n  {'PASS' if passed else 'FAIL'} — {len(metas)} result(s), all difficulty=intermediate: {all_correct}")
     return passed
 
 
@@ -149,34 +189,29 @@ def test_compound_filter(collection):
     print(f"  Filter  : content_type='practice' AND topic='{chosen_topic}'")
 
     try:
-        results = collection.query(
-            query_embeddings=[embed(query)],
-            n_results=2,
+        results = run_query(
+            collection, query, n_results=2,
             where={
                 "$and": [
                     {"content_type": {"$eq": "practice"}},
                     {"topic":        {"$eq": chosen_topic}},
                 ]
-            },
-            include=["documents", "metadatas"]
+            }
         )
     except Exception as e:
         print(f"\n  Filter error: {e}")
         # Fallback: try without compound filter to show data exists
         print("  Falling back to topic-only filter...")
-        results = collection.query(
-            query_embeddings=[embed(query)],
-            n_results=2,
-            where={"topic": {"$eq": chosen_topic}},
-            include=["documents", "metadatas"]
+        results = run_query(
+            collection, query, n_results=2,
+            where={"topic": {"$eq": chosen_topic}}
         )
 
-    print_results(results)
+    n_found = len(results["distances"][0])
+    print_top_result(collection, results)
 
-    docs  = results["documents"][0]
-    metas = results["metadatas"][0]
-    passed = len(docs) > 0
-    print(f"\n  {'PASS' if passed else 'FAIL'} — {len(docs)} result(s) for topic='{chosen_topic}'")
+    passed = n_found > 0
+    print(f"\n  {'PASS' if passed else 'FAIL'} — {n_found} result(s) for topic='{chosen_topic}'")
     return passed
 
 
@@ -196,7 +231,11 @@ def main():
         print("   python ingest_data.py --pdf your_book.pdf --topic 'your_topic' --difficulty intermediate\n")
         return
 
-    collection = get_collection()
+    try:
+        collection = get_collection()
+    except Exception:  # not found (ValueError / NotFoundError across versions)
+        print(f"\n Collection '{COLLECTION_NAME}' not found. Run ingest_data.py first.")
+        return
     total = collection.count()
     print(f"\n  Collection : '{COLLECTION_NAME}'")
     print(f"  Documents  : {total} chunks in DB")
@@ -10,21 +10,49 @@ Tools:
     2. get_student_progress    — reads student mastery from SQLite
     3. update_student_progress — writes quiz score back to SQLite
 
+retrieve_content also has an async path (aretrieve_content) whose query
+embeddings are micro-batched into shared OpenAI requests, and fetch_bundle
+retrieves all three content types for a topic concurrently. When ingest_data.py
+has written an int8 (SQ8) FAISS index for the collection, searches run
+against it and Chroma only serves the documents/metadata.
+
 Install:
     pip install langchain langchain-core langchain-openai chromadb openai pydantic
+    pip install sentence-transformers   # optional: EMBED_BACKEND=local
+    pip install faiss-cpu               # optional: int8-quantized search
 """
 
 import os
+import copy
+import json
+import time
+import queue
+import atexit
+import asyncio
 import sqlite3
-from datetime import datetime
-from typing import Literal
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Literal, Optional
 
 import chromadb
 import openai
 from chromadb.config import Settings
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from langchain_core.tools import tool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+from embedding_backend import (
+    EMBED_BACKEND, EMBED_MODEL, collection_name as backend_collection, local_model,
+    embed_query, cached_query_embedding, cache_query_embeddings,
+)
+
+try:
+    import faiss
+    import numpy as np
+except ImportError:  # optional: fall back to Chroma's own fp32 HNSW search
+    faiss = None
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -33,21 +61,332 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # SHARED: ChromaDB client (re-used across calls)
 # ─────────────────────────────────────────────────────────
 
-def _get_collection(collection_name: str = "learning_companion_kb"):
-    client = chromadb.PersistentClient(
-        path="./chroma_db",
-        settings=Settings(anonymized_telemetry=False)
-    )
-    return client.get_or_create_collection(name=collection_name)
+# The active backend's collection (local vectors live in their own one)
+KB_COLLECTION = backend_collection()
 
+_CLIENT = None
+_COLLECTIONS: dict = {}
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_collection(collection_name: str = KB_COLLECTION):
+    """
+    Return a cached collection handle, opening the client on first use only.
+    Never creates the collection: only ingest_data.py does, so it can record
+    the embedding size. Raises if it hasn't been ingested yet.
+    """
+    global _CLIENT
+    collection = _COLLECTIONS.get(collection_name)
+    if collection is not None:
+        return collection
+
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = chromadb.PersistentClient(
+                path="./chroma_db",
+                settings=Settings(anonymized_telemetry=False)
+            )
+        if collection_name not in _COLLECTIONS:
+            try:
+                _COLLECTIONS[collection_name] = _CLIENT.get_collection(name=collection_name)
+            except Exception as exc:  # ValueError / NotFoundError across versions
+                raise ValueError(
+                    f"Knowledge base '{collection_name}' not found — run ingest_data.py first."
+                ) from exc
+        return _COLLECTIONS[collection_name]
+
+
+if EMBED_BACKEND == "local":
+    local_model()  # load at import, not on the first tool call
+
+
+# In-process LRU of query embeddings, shared by the sync and async paths
+# (functools.lru_cache can't be consulted without running the function)
+_EMBED_LRU: OrderedDict = OrderedDict()  # (text, dimensions) → tuple
+_EMBED_LRU_MAX = 1024
+_EMBED_LRU_LOCK = threading.Lock()
+
+
+def _lru_get(key: tuple) -> Optional[tuple]:
+    with _EMBED_LRU_LOCK:
+        embedding = _EMBED_LRU.get(key)
+        if embedding is not None:
+            _EMBED_LRU.move_to_end(key)
+        return embedding
+
+
+def _lru_put(key: tuple, embedding: tuple) -> None:
+    with _EMBED_LRU_LOCK:
+        _EMBED_LRU[key] = embedding
+        _EMBED_LRU.move_to_end(key)
+        if len(_EMBED_LRU) > _EMBED_LRU_MAX:
+            _EMBED_LRU.popitem(last=False)
+
+
+def _embed(text: str, dimensions: Optional[int] = None) -> tuple[float, ...]:
+    """
+    Generate a single embedding via OpenAI for querying ChromaDB.
+    `dimensions` must match what the collection was ingested with.
+
+    Repeated queries in a session are served from the in-process LRU, and
+    across restarts from the on-disk embedding cache, skipping the HTTP call.
+    Returns a tuple so cached values can't be mutated by callers.
+    With EMBED_BACKEND=local the model runs on-device and `dimensions` is ignored.
+    """
+    key = (text, dimensions)
+    embedding = _lru_get(key)
+    if embedding is not None:
+        return embedding
+
+    embedding = embed_query(text, dimensions)
+    _lru_put(key, embedding)
+    return embedding
+
+
+# ─────────────────────────────────────────────────────────
+# SHARED: vector search (int8 FAISS index if present, else Chroma)
+# ─────────────────────────────────────────────────────────
+
+# collection name → ((index mtime, ids mtime), (faiss index, row ids) or None)
+_SQ8_INDEXES: dict = {}
+_SQ8_LOCK = threading.Lock()
+
+
+def _load_sq8_index(collection):
+    """
+    Return (index, ids) for the SQ8 index ingest_data.py wrote next to the
+    collection, or None if there isn't a usable one. Reloaded whenever a
+    re-ingest rewrites either file.
+
+    The pair is only used when the index, its id list and the collection
+    all hold the same number of vectors; otherwise (a mismatched or
+    half-published pair, or chunks added without a rebuild) searches fall
+    back to Chroma until the files change again.
+    """
+    if faiss is None:
+        return None
+    path = f"./chroma_db/{collection.name}.faiss"
+    ids_path = path + ".ids.json"
+    try:
+        version = (os.stat(path).st_mtime_ns, os.stat(ids_path).st_mtime_ns)
+    except OSError:
+        return None
+
+    cached = _SQ8_INDEXES.get(collection.name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _SQ8_LOCK:
+        try:
+            index = faiss.read_index(path)
+            with open(ids_path) as f:
+                ids = json.load(f)
+        except (OSError, RuntimeError, ValueError):  # replaced mid-read
+            return None
+        consistent = index.ntotal == len(ids) == collection.count()
+        sq8 = (index, ids) if consistent else None
+        _SQ8_INDEXES[collection.name] = (version, sq8)
+    return sq8
+
+
+def _search(collection, query_embeddings: list, n: int) -> list:
+    """
+    Nearest-neighbour search for several query embeddings at once.
+    Returns one [(doc, meta), ...] hit list per query, best first.
+
+    With an SQ8 index the distance computations read 1 byte per dimension
+    instead of 4; the hit ids are then joined back to Chroma in one `get`.
+    """
+    sq8 = _load_sq8_index(collection)
+    if sq8 is None:
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n,
+            include=["documents", "metadatas"]  # distances are never read
+        )
+        return [list(zip(docs, metas))
+                for docs, metas in zip(results["documents"], results["metadatas"])]
+
+    index, ids = sq8
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    faiss.normalize_L2(queries)  # index holds unit vectors: inner product == cosine
+    _, rows = index.search(queries, min(n, index.ntotal))
+    hit_ids = [[ids[r] for r in row if r >= 0] for row in rows]
+
+    wanted = list(dict.fromkeys(i for row in hit_ids for i in row))
+    got = collection.get(ids=wanted, include=["documents", "metadatas"])
+    by_id = {i: (doc, meta) for i, doc, meta in zip(got["ids"], got["documents"], got["metadatas"])}
+    return [[by_id[i] for i in row if i in by_id] for row in hit_ids]
+
+
+# ─────────────────────────────────────────────────────────
+# SHARED: async micro-batchers
+# ─────────────────────────────────────────────────────────
+
+class _MicroBatcher(ABC):
+    """
+    Coalesces concurrent async requests into one backend call.
+
+    Callers enqueue (*args, future); a background task drains up to
+    `max_batch` items, waiting at most `flush_s` after the first arrives,
+    and hands them to `_flush` together, which resolves every future.
+    Parallel tool calls thus share one round trip.
+    """
+
+    def __init__(self, flush_s: float = 0.005, max_batch: int = 64):
+        self.flush_s = flush_s
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # The loop only keeps weak references to tasks; hold in-flight flushes
+        self.flushes: set = set()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((*args, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Flush in the background so the next window starts collecting now
+            flush = loop.create_task(self._flush_guarded(batch))
+            self.flushes.add(flush)
+            flush.add_done_callback(self.flushes.discard)
+
+    async def _flush_guarded(self, batch: list):
+        """Run _flush; whatever happens, no caller is left waiting."""
+        try:
+            await self._flush(batch)
+        except asyncio.CancelledError:
+            for *_, future in batch:
+                future.cancel()
+            raise
+        except Exception as exc:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+
+    @abstractmethod
+    async def _flush(self, batch: list):
+        """Serve every (*args, future) in `batch` with one backend call."""
+
+
+class _EmbedBatcher(_MicroBatcher):
+    """Query embeddings: one OpenAI `input=[...]` request per distinct `dimensions`."""
+
+    def __init__(self, **kwargs):
+        self.client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        super().__init__(**kwargs)
+
+    async def _flush(self, batch: list):
+        groups: dict = {}
+        for text, dimensions, future in batch:
+            groups.setdefault(dimensions, []).append((text, future))
+
+        for dimensions, items in groups.items():
+            texts = [text for text, _ in items]
+            kwargs = {} if dimensions is None else {"dimensions": dimensions}
+            try:
+                response = await self.client.embeddings.create(
+                    model=EMBED_MODEL, input=texts, **kwargs
+                )
+                embeddings = [item.embedding for item in response.data]
+                await asyncio.to_thread(cache_query_embeddings, texts, embeddings, dimensions)
+                for (_, future), embedding in zip(items, embeddings):
+                    if not future.done():
+                        future.set_result(tuple(embedding))
+            except Exception as exc:
+                # One failed dimensions group mustn't fail the others
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(exc)
+
+
+class _QueryBatcher(_MicroBatcher):
+    """
+    Vector searches: all pending embeddings go into one `_search` call
+    (one `collection.query` or one FAISS search + `get`), sharing index
+    warm-up and the Python↔C crossing; each caller gets its own hit list back.
+    """
+
+    def __init__(self, collection, **kwargs):
+        self.collection = collection
+        super().__init__(**kwargs)
+
+    async def _flush(self, batch: list):
+        try:
+            hit_lists = await asyncio.to_thread(
+                _search,
+                self.collection,
+                [embedding for embedding, _, _ in batch],
+                max(n for _, n, _ in batch)
+            )
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for hits, (_, _, future) in zip(hit_lists, batch):
+            if not future.done():
+                future.set_result(hits)
+
+
+# One batcher per event loop (asyncio queues/tasks are loop-bound)
+_EMBED_BATCHERS: dict = {}  # loop → _EmbedBatcher
+_QUERY_BATCHERS: dict = {}  # (loop, collection name) → _QueryBatcher
+
+
+def _get_batcher(registry: dict, key, factory):
+    """Return the registered batcher for `key`, creating it on first use."""
+    batcher = registry.get(key)
+    if batcher is None:
+        batcher = registry[key] = factory()
+        # asyncio.run cancels the batcher's task on shutdown; forget it then,
+        # releasing the closed loop and the batcher's client
+        batcher.task.add_done_callback(lambda _: registry.pop(key, None))
+    return batcher
+
+
+async def _embed_async(text: str, dimensions: Optional[int] = None) -> tuple[float, ...]:
+    """
+    Async counterpart of _embed: in-process LRU, then the disk cache, then
+    the micro-batcher. Blocking SQLite work runs in a worker thread.
+    """
+    key = (text, dimensions)
+    embedding = _lru_get(key)
+    if embedding is not None:
+        return embedding
+
+    if EMBED_BACKEND == "local":
+        # CPU-bound model call — keep it off the event loop
+        return await asyncio.to_thread(_embed, text, dimensions)
+
+    embedding = await asyncio.to_thread(cached_query_embedding, text, dimensions)
+    if embedding is None:
+        loop = asyncio.get_running_loop()
+        batcher = _get_batcher(_EMBED_BATCHERS, loop, _EmbedBatcher)
+        embedding = await batcher.submit(text, dimensions)
+    _lru_put(key, embedding)
+    return embedding
 
-def _embed(text: str) -> list[float]:
-    """Generate a single embedding via OpenAI for querying ChromaDB."""
-    response = openai.embeddings.create(
-        input=[text],
-        model="text-embedding-3-small"
-    )
-    return response.data[0].embedding
+
+async def _query_hits_async(collection, query_embedding: list[float], n: int) -> list:
+    """Async counterpart of _query_hits, routed through the per-loop query batcher."""
+    key = (asyncio.get_running_loop(), collection.name)
+    batcher = _get_batcher(_QUERY_BATCHERS, key, lambda: _QueryBatcher(collection))
+    return await batcher.submit(query_embedding, n)
 
 
 # ─────────────────────────────────────────────────────────
@@ -56,19 +395,63 @@ def _embed(text: str) -> list[float]:
 
 DB_PATH = "./student_progress.db"
 
+# One long-lived connection per thread (sqlite3 connections must not be
+# shared across threads without external locking; ToolNode uses a pool)
+_LOCAL = threading.local()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Return this thread's connection, opening it on first use."""
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        # WAL lets readers proceed during writes; NORMAL skips the extra
+        # fsync per commit (still durable across application crashes)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _LOCAL.conn = conn
+    return conn
+
+
+# WITHOUT ROWID: rows live in the primary-key B-tree itself, so the
+# (student_id, topic) point lookup is one tree walk instead of index + table
+_PROGRESS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        student_id   TEXT NOT NULL,
+        topic        TEXT NOT NULL,
+        mastery_score REAL DEFAULT 0.0,
+        attempts     INTEGER DEFAULT 0,
+        last_studied TEXT,
+        PRIMARY KEY (student_id, topic)
+    ) WITHOUT ROWID
+"""
+
+
+def _migrate_progress_table(conn: sqlite3.Connection) -> None:
+    """Rebuild a student_progress table created before WITHOUT ROWID, in one transaction."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'student_progress'"
+    ).fetchone()
+    if row is None or "WITHOUT ROWID" in row[0].upper():
+        return
+
+    conn.executescript(f"""
+        BEGIN;
+        {_PROGRESS_TABLE_SQL.format(name="student_progress_new")};
+        INSERT INTO student_progress_new
+            SELECT student_id, topic, mastery_score, attempts, last_studied FROM student_progress;
+        DROP TABLE student_progress;
+        ALTER TABLE student_progress_new RENAME TO student_progress;
+        COMMIT;
+    """)
+
+
 def _init_db():
     """Create SQLite tables if they don't exist yet."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS student_progress (
-            student_id   TEXT NOT NULL,
-            topic        TEXT NOT NULL,
-            mastery_score REAL DEFAULT 0.0,
-            attempts     INTEGER DEFAULT 0,
-            last_studied TEXT,
-            PRIMARY KEY (student_id, topic)
-        )
-    """)
+    conn = _get_conn()
+    # journal_mode is persisted in the database file, so set it once here
+    conn.execute("PRAGMA journal_mode=WAL")
+    _migrate_progress_table(conn)
+    conn.execute(_PROGRESS_TABLE_SQL.format(name="student_progress"))
     conn.execute("""
         CREATE TABLE IF NOT EXISTS study_sessions (
             session_id   TEXT PRIMARY KEY,
@@ -78,17 +461,94 @@ def _init_db():
             timestamp    TEXT
         )
     """)
+    # Per-student, per-topic history, newest first
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS study_sessions_student_topic_ts
+        ON study_sessions (student_id, topic, timestamp DESC)
+    """)
     conn.commit()
-    conn.close()
+
+
+# Last (epoch second, ISO string) pair; a tuple so updates are atomic
+_LAST_ISO = (None, "")
+
+
+def _now_iso() -> str:
+    """Local time as ISO-8601 (to the second), formatted at most once per second."""
+    global _LAST_ISO
+    sec = int(time.time())
+    if _LAST_ISO[0] != sec:
+        _LAST_ISO = (sec, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(sec)))
+    return _LAST_ISO[1]
+
+
+# ─────────────────────────────────────────────────────────
+# SHARED: background session-log writer
+# ─────────────────────────────────────────────────────────
+# study_sessions rows are telemetry — no tool result depends on them — so
+# they are queued and written in batches off the request path.
+
+_INSERT_SESSION_SQL = (
+    "INSERT INTO study_sessions (session_id, student_id, topic, score, timestamp) VALUES (?,?,?,?,?)"
+)
+_SESSION_LOG_Q: queue.Queue = queue.Queue()
+_SESSION_LOG_STOP = object()   # queued at exit: flush what's left, then stop
+_SESSION_FLUSH_S = 0.1
+_SESSION_BATCH_MAX = 100
+_SESSION_SHUTDOWN_S = 5.0      # longest exit will wait for the final flush
+
+
+def _session_log_writer():
+    """Daemon loop: gather up to _SESSION_BATCH_MAX rows or _SESSION_FLUSH_S, then executemany."""
+    conn = None
+    stopping = False
+    while not stopping:
+        batch = [_SESSION_LOG_Q.get()]
+        deadline = time.monotonic() + _SESSION_FLUSH_S
+        while len(batch) < _SESSION_BATCH_MAX:
+            try:
+                batch.append(_SESSION_LOG_Q.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        rows = [row for row in batch if row is not _SESSION_LOG_STOP]
+        stopping = len(rows) != len(batch)
+        if not rows:
+            continue
+        # Any failure (connection included) drops this batch only; the
+        # thread must survive so later rows and shutdown still work
+        try:
+            if conn is None:
+                conn = _get_conn()
+            with conn:
+                conn.executemany(_INSERT_SESSION_SQL, rows)
+        except Exception as e:
+            print(f"⚠ Failed to log {len(rows)} study session(s): {e}")
+
+
+def _stop_session_log_writer():
+    """Flush pending session rows at exit, without ever hanging the interpreter."""
+    _SESSION_LOG_Q.put(_SESSION_LOG_STOP)
+    _SESSION_LOG_THREAD.join(timeout=_SESSION_SHUTDOWN_S)
+
 
 _init_db()
 
+_SESSION_LOG_THREAD = threading.Thread(
+    target=_session_log_writer, name="session-log-writer", daemon=True
+)
+_SESSION_LOG_THREAD.start()
+atexit.register(_stop_session_log_writer)
+
 
 # ═════════════════════════════════════════════════════════
 # TOOL 1: retrieve_content
 # ═════════════════════════════════════════════════════════
 
 class RetrieveContentInput(BaseModel):
+    # Strict args: unknown keys from the LLM are rejected instead of silently
+    # ignored, surrounding whitespace is stripped, and parsed args are read-only
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True, frozen=True)
+
     topic: str = Field(
         description="The subject topic to retrieve content about. E.g. 'neural_networks', 'photosynthesis'."
     )
@@ -109,11 +569,96 @@ class RetrieveContentInput(BaseModel):
     )
 
 
+def _overfetch(n_results: int) -> int:
+    """How many unfiltered hits to pull so the Python-side filter has room."""
+    return max(n_results * 4, 20)
+
+
+def _query_hits(collection, query_embedding: list[float], n: int) -> list:
+    """Unfiltered semantic search returning [(doc, meta), ...]."""
+    return _search(collection, [query_embedding], n)[0]
+
+
+def _select(hits: list, topic_key: str, content_type: str, difficulty: str, n_results: int):
+    """
+    Apply the topic/content_type/difficulty filter in Python to over-fetched
+    hits. If nothing matches, the top unfiltered hits are the fallback — so
+    the cold-content case costs one HNSW traversal instead of two.
+    Returns (pairs, filtered): the selected [(doc, meta), ...] and whether
+    they passed the filter (False = unfiltered fallback).
+    """
+    # Field-by-field, topic first: most off-target hits fail the first
+    # compare, and no per-hit key tuple is allocated
+    matches = [
+        (doc, meta) for doc, meta in hits
+        if meta.get("topic") == topic_key
+        and meta.get("content_type") == content_type
+        and meta.get("difficulty") == difficulty
+    ][:n_results]
+
+    if not matches:
+        # Fallback: semantic search without strict metadata filter
+        return hits[:n_results], False
+
+    return matches, True
+
+
+def _format_results(matches: list, filtered: bool,
+                    topic: str, content_type: str, difficulty: str) -> dict:
+    if not matches:
+        return {
+            "results": [],
+            "filtered": False,
+            "message": f"No content found for topic='{topic}', type='{content_type}', difficulty='{difficulty}'.",
+        }
+
+    return {
+        "filtered": filtered,
+        "results": [
+            {
+                "source": meta.get("source_file", "unknown"),
+                "page":   meta.get("start_page"),
+                "text":   doc,
+            }
+            for doc, meta in matches
+        ]
+    }
+
+
+# Whole-result cache: a tutoring session re-requests the same
+# (topic, content_type, difficulty) often; a hit skips embed + search + format.
+# Entries expire so a re-ingest shows up within _RESULT_TTL_S. Callers
+# always get their own copy, so mutating a result can't corrupt the cache.
+_RESULT_TTL_S = 300
+_RESULT_CACHE_MAX = 512
+_RESULT_CACHE: dict = {}  # key → (expires_at, result)
+_RESULT_LOCK = threading.Lock()
+
+
+def _cached_result(key: tuple) -> Optional[dict]:
+    entry = _RESULT_CACHE.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return copy.deepcopy(entry[1])
+
+
+def _cache_result(key: tuple, result: dict) -> None:
+    now = time.monotonic()
+    with _RESULT_LOCK:
+        if key not in _RESULT_CACHE and len(_RESULT_CACHE) >= _RESULT_CACHE_MAX:
+            for k in [k for k, (expires, _) in _RESULT_CACHE.items() if expires < now]:
+                del _RESULT_CACHE[k]
+            if len(_RESULT_CACHE) >= _RESULT_CACHE_MAX:
+                # Still full: evict the oldest insertion (dicts keep order)
+                del _RESULT_CACHE[next(iter(_RESULT_CACHE))]
+        _RESULT_CACHE[key] = (now + _RESULT_TTL_S, copy.deepcopy(result))
+
+
 @tool(args_schema=RetrieveContentInput)
 def retrieve_content(topic: str,
                      content_type: str,
                      difficulty: str,
-                     n_results: int = 3) -> str:
+                     n_results: int = 3) -> dict:
     """
     Retrieve relevant course material from the vector knowledge base.
 
@@ -122,51 +667,88 @@ def retrieve_content(topic: str,
     - The prerequisite knowledge required before teaching a topic
     - Practice problems to test the student's understanding
 
-    The tool performs a semantic search filtered by topic, content_type, and difficulty,
-    so results are always appropriate for the student's current level.
+    The tool performs a semantic search and keeps the closest chunks tagged with
+    this topic, content_type, and difficulty. If none of the nearest candidates
+    carry those tags, it falls back to the closest chunks regardless of tags.
 
-    Returns the top matching chunks of course content as a single string.
+    Returns {"filtered": bool, "results": [{"source", "page", "text"}, ...]}
+    with the top chunks of course content, best match first. "filtered" is
+    False for fallback content, which may not match the requested type or
+    level — adapt it rather than presenting it as level-appropriate.
     """
+    # Canonical key: used for the filter and the query text, so equivalent
+    # requests hit the same embedding-cache entry
+    topic_key = topic.lower().replace(" ", "_")
+    key = (topic_key, content_type, difficulty, n_results)
+    cached = _cached_result(key)
+    if cached is not None:
+        return cached
+
     collection = _get_collection()
-    query_text = f"{topic} {content_type} {difficulty}"
-    query_embedding = _embed(query_text)
-
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        where={
-            "$and": [
-                {"topic":        {"$eq": topic.lower().replace(" ", "_")}},
-                {"content_type": {"$eq": content_type}},
-                {"difficulty":   {"$eq": difficulty}},
-            ]
-        },
-        include=["documents", "metadatas", "distances"]
-    )
+    query_text = f"{topic_key} {content_type} {difficulty}"
+    dimensions = (collection.metadata or {}).get("embedding_dimensions")
+    query_embedding = list(_embed(query_text, dimensions))
 
-    if not results["documents"] or not results["documents"][0]:
-        # Fallback: semantic search without strict metadata filter
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            include=["documents", "metadatas"]
-        )
+    hits = _query_hits(collection, query_embedding, _overfetch(n_results))
+    matches, filtered = _select(hits, topic_key, content_type, difficulty, n_results)
+    result = _format_results(matches, filtered, topic, content_type, difficulty)
+    _cache_result(key, result)
+    return result
 
-    docs = results["documents"][0]
-    metas = results["metadatas"][0]
 
-    if not docs:
-        return f"No content found for topic='{topic}', type='{content_type}', difficulty='{difficulty}'."
+async def aretrieve_content(topic: str,
+                            content_type: str,
+                            difficulty: str,
+                            n_results: int = 3) -> dict:
+    """
+    Async implementation of retrieve_content. The query embedding and the
+    Chroma search both go through micro-batchers, so parallel tool calls
+    share one OpenAI request and one native collection.query call.
+    """
+    topic_key = topic.lower().replace(" ", "_")
+    key = (topic_key, content_type, difficulty, n_results)
+    cached = _cached_result(key)
+    if cached is not None:
+        return cached
 
-    output_parts = []
-    for i, (doc, meta) in enumerate(zip(docs, metas), start=1):
-        source = meta.get("source_file", "unknown")
-        page   = meta.get("start_page", "?")
-        output_parts.append(
-            f"[Result {i} | Source: {source}, Page {page}]\n{doc}"
-        )
+    collection = _get_collection()
+    query_text = f"{topic_key} {content_type} {difficulty}"
+    dimensions = (collection.metadata or {}).get("embedding_dimensions")
+    query_embedding = list(await _embed_async(query_text, dimensions))
 
-    return "\n\n---\n\n".join(output_parts)
+    hits = await _query_hits_async(collection, query_embedding, _overfetch(n_results))
+    matches, filtered = _select(hits, topic_key, content_type, difficulty, n_results)
+    result = _format_results(matches, filtered, topic, content_type, difficulty)
+    _cache_result(key, result)
+    return result
+
+
+# Give the tool a native async path: LangGraph's ToolNode awaits it (and
+# gathers parallel calls) instead of running the sync body in a thread.
+retrieve_content.coroutine = aretrieve_content
+
+
+def _as_content_type(content_type: str) -> RunnableLambda:
+    return RunnableLambda(lambda args: {**args, "content_type": content_type})
+
+
+# prerequisites + explanation + practice for one topic, fanned out
+# concurrently; the three searches share the micro-batchers above
+_BUNDLE = RunnableParallel({
+    content_type: _as_content_type(content_type) | retrieve_content
+    for content_type in ("prerequisites", "explanation", "practice")
+})
+
+
+async def fetch_bundle(topic: str, difficulty: str, n_results: int = 3) -> dict:
+    """
+    Fetch prerequisites, explanation and practice material for a topic in
+    one concurrent round. Returns {"prerequisites": ..., "explanation": ...,
+    "practice": ...}, each value being a retrieve_content result.
+    """
+    return await _BUNDLE.ainvoke(
+        {"topic": topic, "difficulty": difficulty, "n_results": n_results}
+    )
 
 
 # ═════════════════════════════════════════════════════════
@@ -174,6 +756,8 @@ def retrieve_content(topic: str,
 # ═════════════════════════════════════════════════════════
 
 class GetStudentProgressInput(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True, frozen=True)
+
     student_id: str = Field(
         description="Unique identifier for the student. E.g. 'student_123'."
     )
@@ -183,7 +767,7 @@ class GetStudentProgressInput(BaseModel):
 
 
 @tool(args_schema=GetStudentProgressInput)
-def get_student_progress(student_id: str, topic: str) -> str:
+def get_student_progress(student_id: str, topic: str) -> dict:
     """
     Check a student's current mastery level and learning history for a given topic.
 
@@ -192,32 +776,37 @@ def get_student_progress(student_id: str, topic: str) -> str:
     - Decide whether prerequisites need review (mastery_score < 0.7 = needs review)
     - Personalise difficulty: if mastery is high, use harder explanations/problems
 
-    Returns mastery score (0.0–1.0), number of attempts, and last study date.
-    A mastery score of 0.0 means the student has not studied this topic yet.
+    Returns {"student_id", "topic", "mastery", "status", "attempts", "last_studied"}
+    with mastery in 0.0–1.0. A mastery of 0.0 with status "new topic" means the
+    student has not studied this topic yet.
     """
-    conn = sqlite3.connect(DB_PATH)
+    topic_key = topic.lower().replace(" ", "_")
+    conn = _get_conn()
     row = conn.execute(
         "SELECT mastery_score, attempts, last_studied FROM student_progress "
         "WHERE student_id = ? AND topic = ?",
-        (student_id, topic.lower().replace(" ", "_"))
+        (student_id, topic_key)
     ).fetchone()
-    conn.close()
 
     if row is None:
-        return (
-            f"No progress record found for student '{student_id}' on topic '{topic}'. "
-            f"This is likely a new topic for them. Mastery: 0.0, Attempts: 0."
-        )
+        return {
+            "student_id":   student_id,
+            "topic":        topic,
+            "mastery":      0.0,
+            "status":       "new topic",
+            "attempts":     0,
+            "last_studied": None,
+        }
 
     mastery, attempts, last_studied = row
-    status = "needs review" if mastery < 0.7 else "proficient"
-
-    return (
-        f"Student '{student_id}' | Topic: '{topic}'\n"
-        f"  Mastery Score : {mastery:.2f} ({status})\n"
-        f"  Attempts      : {attempts}\n"
-        f"  Last Studied  : {last_studied or 'never'}"
-    )
+    return {
+        "student_id":   student_id,
+        "topic":        topic,
+        "mastery":      round(mastery, 2),
+        "status":       "needs review" if mastery < 0.7 else "proficient",
+        "attempts":     attempts,
+        "last_studied": last_studied,
+    }
 
 
 # ═════════════════════════════════════════════════════════
@@ -225,6 +814,8 @@ def get_student_progress(student_id: str, topic: str) -> str:
 # ═════════════════════════════════════════════════════════
 
 class UpdateStudentProgressInput(BaseModel):
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True, frozen=True)
+
     student_id: str = Field(
         description="Unique identifier for the student."
     )
@@ -240,8 +831,21 @@ class UpdateStudentProgressInput(BaseModel):
     )
 
 
+# Fixed statement text, so each connection's sqlite3 statement cache re-uses
+# the compiled statements. Upsert needs SQLite >= 3.35 (RETURNING); in
+# DO UPDATE, bare column names refer to the row's values before the update.
+_UPSERT_PROGRESS_SQL = """
+    INSERT INTO student_progress (student_id, topic, mastery_score, attempts, last_studied)
+    VALUES (?, ?, ?, 1, ?)
+    ON CONFLICT(student_id, topic) DO UPDATE SET
+        mastery_score = ((mastery_score * attempts) + excluded.mastery_score) / (attempts + 1),
+        attempts      = attempts + 1,
+        last_studied  = excluded.last_studied
+    RETURNING mastery_score, attempts
+"""
+
 @tool(args_schema=UpdateStudentProgressInput)
-def update_student_progress(student_id: str, topic: str, score: float) -> str:
+def update_student_progress(student_id: str, topic: str, score: float) -> dict:
     """
     Record a student's latest quiz or practice score and update their mastery level.
 
@@ -250,50 +854,30 @@ def update_student_progress(student_id: str, topic: str, score: float) -> str:
     picture of long-term understanding rather than just the last attempt.
 
     Call this tool to close the learning loop so progress is tracked over sessions.
-    Returns a confirmation with the updated mastery score.
+    Returns {"student_id", "topic", "latest_score", "mastery", "attempts", "status"}
+    with the updated mastery score.
     """
     topic_key = topic.lower().replace(" ", "_")
-    now = datetime.now().isoformat()
-    session_id = f"{student_id}_{topic_key}_{now}"
-
-    conn = sqlite3.connect(DB_PATH)
-
-    # Upsert: running average of mastery
-    existing = conn.execute(
-        "SELECT mastery_score, attempts FROM student_progress WHERE student_id=? AND topic=?",
-        (student_id, topic_key)
-    ).fetchone()
-
-    if existing:
-        old_mastery, attempts = existing
-        new_attempts = attempts + 1
-        new_mastery = ((old_mastery * attempts) + score) / new_attempts
-        conn.execute(
-            "UPDATE student_progress SET mastery_score=?, attempts=?, last_studied=? "
-            "WHERE student_id=? AND topic=?",
-            (new_mastery, new_attempts, now, student_id, topic_key)
-        )
-    else:
-        new_mastery = score
-        new_attempts = 1
-        conn.execute(
-            "INSERT INTO student_progress (student_id, topic, mastery_score, attempts, last_studied) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (student_id, topic_key, score, 1, now)
-        )
-
-    # Log session
-    conn.execute(
-        "INSERT INTO study_sessions (session_id, student_id, topic, score, timestamp) VALUES (?,?,?,?,?)",
-        (session_id, student_id, topic_key, score, now)
-    )
-    conn.commit()
-    conn.close()
-
-    status = "✓ Mastery achieved!" if new_mastery >= 0.7 else "⟳ Needs more practice."
-    return (
-        f"Progress updated for '{student_id}' on '{topic}'.\n"
-        f"  Latest Score  : {score:.2f}\n"
-        f"  New Mastery   : {new_mastery:.2f} (after {new_attempts} attempt(s))\n"
-        f"  Status        : {status}"
-    )
\ No newline at end of file
+    now = _now_iso()
+    # `now` is second-resolution, so the nanosecond clock keeps ids unique
+    session_id = f"{student_id}_{topic_key}_{time.time_ns()}"
+
+    conn = _get_conn()
+
+    # Upsert: running average of mastery, computed in SQL
+    with conn:
+        new_mastery, new_attempts = conn.execute(
+            _UPSERT_PROGRESS_SQL, (student_id, topic_key, score, now)
+        ).fetchone()
+
+    # Log session (written asynchronously by the background writer)
+    _SESSION_LOG_Q.put((session_id, student_id, topic_key, score, now))
+
+    return {
+        "student_id":   student_id,
+        "topic":        topic,
+        "latest_score": round(score, 2),
+        "mastery":      round(new_mastery, 2),
+        "attempts":     new_attempts,
+        "status":       "mastery achieved" if new_mastery >= 0.7 else "needs more practice",
+    }
\ No newline at end of file